@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark `sevpy which` / `sevpy run` dispatch overhead.
+
+Builds a fake install root with a few dozen prefixes (the "interpreter"
+in each is a symlink to the running Python), then measures:
+
+  * in-process resolution with a warm index and with a cold index
+  * end-to-end `sevpy run <spec> -- -c pass` vs. running the interpreter
+    directly, i.e. the overhead a job runner actually pays, and that
+    overhead minus sevpy's own interpreter start-up
+
+Usage: python benchmarks/bench_dispatch.py [--runs N]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO / "sevpy"))
+
+from libs.dispatch import find_interpreter, load_index  # noqa: E402
+
+
+def make_tree(home: Path, count: int):
+    root = home / ".local" / "opt"
+    major, minor = sys.version_info[:2]
+    for micro in range(count):
+        prefix = root / f"python-{major}.{minor}.{micro}"
+        (prefix / "bin").mkdir(parents=True)
+        (prefix / "bin" / f"python{major}.{minor}").symlink_to(sys.executable)
+        (prefix / ".install-manifest").write_text("")
+    return root, f"{major}.{minor}"
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        t1 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t1) * 1000)
+    return statistics.median(samples), min(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--prefixes", type=int, default=40)
+    opts = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        home = Path(tmp)
+        root, spec = make_tree(home, opts.prefixes)
+        root = str(root)
+        index = home / ".cache" / "sevpy" / "index"
+
+        load_index(root, str(index))
+        warm = timed(lambda: find_interpreter(spec, root, str(index)), opts.runs)
+
+        def cold():
+            index.unlink(missing_ok=True)
+            find_interpreter(spec, root, str(index))
+
+        cold_t = timed(cold, opts.runs)
+
+        env = dict(os.environ, HOME=tmp)
+        sevpy = [sys.executable, str(REPO / "sevpy" / "sevpy.py")]
+        run = lambda cmd: subprocess.run(cmd, env=env, check=True)
+
+        run([*sevpy, "which", spec])  # warm the on-disk index
+        direct = timed(lambda: run([sys.executable, "-c", "pass"]), opts.runs)
+        via = timed(lambda: run([*sevpy, "run", spec, "--", "-c", "pass"]), opts.runs)
+
+    print(f"{'case':<34}{'median ms':>12}{'min ms':>10}")
+    print(f"{'resolve (warm index)':<34}{warm[0]:>12.3f}{warm[1]:>10.3f}")
+    print(f"{'resolve (cold index)':<34}{cold_t[0]:>12.3f}{cold_t[1]:>10.3f}")
+    print(f"{'python -c pass':<34}{direct[0]:>12.2f}{direct[1]:>10.2f}")
+    print(f"{'sevpy run ' + spec + ' -- -c pass':<34}{via[0]:>12.2f}{via[1]:>10.2f}")
+    print(f"{'dispatch overhead':<34}{via[0] - direct[0]:>12.2f}")
+    # sevpy itself is a Python process; its bare start-up is the floor
+    print(f"{'  beyond sevpy start-up':<34}{via[0] - 2 * direct[0]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
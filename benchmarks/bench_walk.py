@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark tree scans on a synthetic install-like tree (50k files by
+default, with a sprinkling of symlinks).
+
+Compares the previous pathlib-based scans with libs.path_utils.walk_tree:
+
+  * find_files: rglob + is_symlink + is_file vs. walk_tree
+  * verify + manifest: rglob + resolve() per entry followed by a second
+    rglob for the manifest vs. one fused walk_tree pass
+
+By default the page cache is warm. --cold drops the kernel caches before
+every run (Linux, root only) to measure directory reads that block on
+the disk. Pass --dir to build the tree on the filesystem of interest.
+
+Usage: python benchmarks/bench_walk.py [--files N] [--runs N] [--cold] [--dir PATH]
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO / "sevpy"))
+
+from libs.path_utils import walk_tree, find_files  # noqa: E402
+
+
+def make_tree(root: Path, files: int):
+    per_dir = 100
+    dirs = max(files // per_dir, 1)
+    fanout = 10
+
+    for d in range(dirs):
+        sub = root / f"pkg{d // fanout}" / f"mod{d % fanout}"
+        sub.mkdir(parents=True)
+        for f in range(per_dir):
+            (sub / f"file{f}.py").write_bytes(b"")
+        (sub / "link.py").symlink_to("file0.py")
+
+
+def legacy_find(root: Path, regex):
+    results = []
+    for path in root.rglob("*"):
+        try:
+            if path.is_symlink():
+                continue
+            if path.is_file() and regex.search(path.name):
+                results.append(path)
+        except OSError:
+            continue
+    return results
+
+
+def legacy_verify_and_manifest(root: Path):
+    for path in root.rglob("*"):
+        resolved = path.resolve()
+        if not str(resolved).startswith(str(root)):
+            raise RuntimeError(path)
+
+    return [str(p) for p in root.rglob("*") if p.is_file() or p.is_symlink()]
+
+
+def fused_verify_and_manifest(root: Path):
+    base = os.path.realpath(root)
+    entries = []
+    for entry in walk_tree(base):
+        if entry.is_symlink():
+            resolved = os.path.realpath(entry.path)
+            if not os.path.exists(resolved) or not resolved.startswith(base + os.sep):
+                raise RuntimeError(entry.path)
+            entries.append(entry.path)
+        elif entry.is_file(follow_symlinks=False):
+            entries.append(entry.path)
+    return entries
+
+
+def drop_caches():
+    os.sync()
+    with open("/proc/sys/vm/drop_caches", "w") as f:
+        f.write("3\n")
+
+
+def timed(fn, runs, cold=False):
+    samples = []
+    for _ in range(runs):
+        if cold:
+            drop_caches()
+        t1 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t1) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=50_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--cold", action="store_true", help="drop page cache before each run")
+    parser.add_argument("--dir", help="create the test tree under this directory")
+    opts = parser.parse_args()
+
+    regex = re.compile(r"^file7\d\.py$")
+
+    with tempfile.TemporaryDirectory(dir=opts.dir) as tmp:
+        root = Path(tmp)
+        make_tree(root, opts.files)
+
+        assert len(legacy_find(root, regex)) == len(find_files(root, regex))
+        assert len(legacy_verify_and_manifest(root)) == len(fused_verify_and_manifest(root))
+
+        cases = [
+            ("find_files: rglob (before)", lambda: legacy_find(root, regex)),
+            ("find_files: walk_tree", lambda: find_files(root, regex)),
+            ("verify+manifest: rglob (before)", lambda: legacy_verify_and_manifest(root)),
+            ("verify+manifest: fused walk_tree", lambda: fused_verify_and_manifest(root)),
+        ]
+
+        cache = "cold" if opts.cold else "warm"
+        print(f"{opts.files} files, {cache} cache, median of {opts.runs} runs")
+        print(f"{'case':<36}{'ms':>10}")
+        for name, fn in cases:
+            print(f"{name:<36}{timed(fn, opts.runs, opts.cold):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Fast interpreter lookup for `sevpy which` and `sevpy run`.
+
+This module is loaded before the rest of sevpy and deliberately imports
+nothing but `os` and `sys` (both already loaded at interpreter start-up):
+pathlib, re and json alone cost more than the lookup itself. Dispatching
+is a couple of stat() calls and a small text read.
+"""
+import os
+import sys
+
+HOME = os.path.expanduser("~")
+INSTALL_ROOT = os.path.join(HOME, ".local", "opt")
+INDEX_PATH = os.path.join(HOME, ".cache", "sevpy", "index")
+
+MANIFEST_NAME = ".install-manifest"
+
+
+def _split_version(version: str):
+    """'3.12.2rc1' -> ((3, 12, 2), 'rc1'); None if not a version."""
+    parts = version.split(".", 2)
+    if len(parts) < 2 or not parts[0].isdigit() or not parts[1].isdigit():
+        return None
+
+    micro, suffix = 0, ""
+    if len(parts) == 3:
+        tail = parts[2]
+        digits = len(tail) - len(tail.lstrip("0123456789"))
+        if digits == 0:
+            return None
+        micro, suffix = int(tail[:digits]), tail[digits:]
+
+    return (int(parts[0]), int(parts[1]), micro), suffix
+
+
+def version_key(version: str):
+    """Sort key: numeric parts first, final releases after pre-releases."""
+    split = _split_version(version)
+    if split is None:
+        return ((-1, -1, -1), False, version)
+    numbers, suffix = split
+    return (numbers, suffix == "", suffix)
+
+
+def _interpreter_for(prefix: str, version: str):
+    split = _split_version(version)
+    if split is None:
+        return None
+
+    major, minor = split[0][:2]
+    python = os.path.join(prefix, "bin", f"python{major}.{minor}")
+    if not os.path.isfile(os.path.join(prefix, MANIFEST_NAME)):
+        return None
+    if not os.access(python, os.X_OK):
+        return None
+    return python
+
+
+def build_index(install_root: str = INSTALL_ROOT) -> dict:
+    """
+    Map installed versions to their interpreter without running anything.
+    Only sevpy-managed prefixes (those with a manifest) are indexed.
+    """
+    versions = {}
+
+    try:
+        entries = list(os.scandir(install_root))
+    except OSError:
+        entries = []
+
+    for entry in entries:
+        if not entry.name.startswith("python-") or not entry.is_dir():
+            continue
+
+        version = entry.name[len("python-"):]
+        python = _interpreter_for(entry.path, version)
+        if python is not None:
+            versions[version] = python
+
+    return versions
+
+
+def _root_mtime(install_root: str) -> str:
+    try:
+        return str(os.stat(install_root).st_mtime_ns)
+    except OSError:
+        return "-"
+
+
+def load_index(
+    install_root: str = INSTALL_ROOT,
+    index_path: str = INDEX_PATH,
+    *,
+    refresh: bool = False,
+) -> dict:
+    """
+    Return the cached version index, rebuilding it when the install root
+    has changed (entries added, removed or swapped) since it was written.
+
+    The index is plain text: the install root's mtime on the first line,
+    then one `version<TAB>interpreter` line per installed version.
+    """
+    mtime = _root_mtime(install_root)
+
+    if not refresh:
+        try:
+            with open(index_path) as f:
+                lines = f.read().splitlines()
+            if lines and lines[0] == mtime:
+                return dict(line.split("\t", 1) for line in lines[1:] if line)
+        except (OSError, ValueError):
+            pass
+
+    versions = build_index(install_root)
+
+    body = "".join(f"{v}\t{p}\n" for v, p in versions.items())
+    tmp = f"{index_path}.{os.getpid()}"
+    try:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        with open(tmp, "w") as f:
+            f.write(f"{mtime}\n{body}")
+        os.replace(tmp, index_path)
+    except OSError:
+        # A read-only cache only costs us the rebuild next time
+        pass
+
+    return versions
+
+
+def resolve(spec: str, versions: dict):
+    """
+    Resolve a version spec against the index.
+
+    `3.12.2` (or `3.13.0rc1`) must match exactly; `3.12` or `3` pick the
+    newest installed final release in that series, and only fall back to
+    a pre-release when no final release is installed.
+    Returns (version, python) or None.
+    """
+    if spec in versions:
+        return spec, versions[spec]
+
+    candidates = [v for v in versions if v.startswith(f"{spec}.")]
+    if not candidates:
+        return None
+
+    finals = [v for v in candidates if version_key(v)[1]]
+    best = max(finals or candidates, key=version_key)
+    return best, versions[best]
+
+
+def find_interpreter(
+    spec: str,
+    install_root: str = INSTALL_ROOT,
+    index_path: str = INDEX_PATH,
+):
+    """Resolve `spec` to an interpreter path, or None if not installed."""
+    found = resolve(spec, load_index(install_root, index_path))
+
+    # Cheap staleness check; rebuild once if the binary has gone away
+    if found is None or not os.access(found[1], os.X_OK):
+        found = resolve(spec, load_index(install_root, index_path, refresh=True))
+
+    return found[1] if found else None
+
+
+def main(argv) -> int:
+    """Entry point for `sevpy which <spec>` and `sevpy run <spec> [--] ...`."""
+    cmd, rest = argv[0], argv[1:]
+
+    if not rest:
+        print(f"Error: specify a version (e.g. sevpy {cmd} 3.12)", file=sys.stderr)
+        return 2
+
+    spec, args = rest[0], rest[1:]
+    if args[:1] == ["--"]:
+        args = args[1:]
+
+    python = find_interpreter(spec)
+    if python is None:
+        print(f"[X] No installed Python matches {spec}", file=sys.stderr)
+        return 1
+
+    if cmd == "which":
+        print(python)
+        return 0
+
+    try:
+        os.execv(python, [python, *args])
+    except OSError as e:
+        print(f"[X] Failed to run {python}: {e}", file=sys.stderr)
+        return 1
@@ -0,0 +1,180 @@
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import os
+import shutil
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from libs.path_utils import walk_tree
+
+AT_FDCWD = -100
+RENAME_EXCHANGE = 1 << 1
+
+_libc = None
+
+
+def _renameat2():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+    fn = getattr(_libc, "renameat2", None)
+    if fn is not None:
+        fn.argtypes = [
+            ctypes.c_int, ctypes.c_char_p,
+            ctypes.c_int, ctypes.c_char_p,
+            ctypes.c_uint,
+        ]
+        fn.restype = ctypes.c_int
+    return fn
+
+
+def exchange_paths(a: Path, b: Path) -> bool:
+    """
+    Swap two existing paths on the same filesystem.
+
+    Uses renameat2(RENAME_EXCHANGE) so that `b` is never missing, not even
+    for an instant. On kernels/filesystems/libcs without it, falls back to
+    three renames, which leaves `b` absent for a short window.
+
+    Returns True if the swap was atomic.
+    """
+    a, b = Path(a), Path(b)
+
+    renameat2 = _renameat2()
+    if renameat2 is not None:
+        rc = renameat2(
+            AT_FDCWD, os.fsencode(a),
+            AT_FDCWD, os.fsencode(b),
+            RENAME_EXCHANGE,
+        )
+        if rc == 0:
+            return True
+
+        err = ctypes.get_errno()
+        if err not in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+            raise OSError(err, os.strerror(err), str(a), None, str(b))
+
+    tmp = a.with_name(f"{a.name}.swap-{os.getpid()}")
+    a.rename(tmp)
+    try:
+        b.rename(a)
+    except OSError:
+        tmp.rename(a)
+        raise
+    tmp.rename(b)
+    return False
+
+
+# ioctl(FICLONE) from linux/fs.h
+FICLONE = 0x40049409
+
+
+def reflink(src, dst) -> bool:
+    """
+    Create `dst` as a copy-on-write clone of `src` (btrfs, XFS, ...).
+
+    Returns False, leaving no `dst` behind, if the filesystem cannot
+    share extents between the two paths.
+    """
+    with open(src, "rb") as fsrc:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            fcntl.ioctl(fd, FICLONE, fsrc.fileno())
+        except OSError:
+            os.close(fd)
+            os.unlink(dst)
+            return False
+        os.close(fd)
+    return True
+
+
+def _copy_data(src: str, dst: str):
+    """Copy file contents: reflink, then copy_file_range, then read/write."""
+    if reflink(src, dst):
+        return
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        if hasattr(os, "copy_file_range"):
+            try:
+                # In-kernel copy; returns 0 at end of file
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30):
+                    pass
+                return
+            except OSError:
+                # EXDEV on older kernels, ENOSYS, unsupported filesystems...
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+        shutil.copyfileobj(fsrc, fdst, 1 << 20)
+
+
+def fsync_path(path):
+    """fsync() a file or directory; for a directory this makes renames in it durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _copy_file(src: str, dst: str, st: os.stat_result):
+    _copy_data(src, dst)
+    os.chmod(dst, stat.S_IMODE(st.st_mode))
+    # Keep mtimes: timestamp-based .pyc files are validated against them
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+    fsync_path(dst)
+
+
+def copy_tree(src: Path, dst: Path, workers: int = None):
+    """
+    Copy a directory tree to another filesystem, preserving symlinks,
+    hard links, modes and timestamps, with file data copied by a thread
+    pool and everything fsync()ed before returning. `dst` must not exist.
+    """
+    src, dst = str(src), str(dst)
+    os.mkdir(dst)
+
+    dirs = [(src, dst)]
+    files = []
+    linked = []  # (first copy, link) for hard-linked files
+    seen_inodes = {}
+
+    # Parents are listed before their contents, so directories exist
+    # by the time anything is created inside them
+    for entry in walk_tree(src):
+        s_path = entry.path
+        d_path = os.path.join(dst, s_path[len(src) + 1:])
+        st = entry.stat(follow_symlinks=False)
+
+        # walk_tree does not descend into symlinked directories,
+        # so they are recreated as links here like any other symlink
+        if stat.S_ISLNK(st.st_mode):
+            os.symlink(os.readlink(s_path), d_path)
+            os.utime(d_path, ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=False)
+        elif stat.S_ISDIR(st.st_mode):
+            os.mkdir(d_path)
+            dirs.append((s_path, d_path))
+        elif st.st_nlink > 1 and (st.st_dev, st.st_ino) in seen_inodes:
+            linked.append((seen_inodes[(st.st_dev, st.st_ino)], d_path))
+        else:
+            if st.st_nlink > 1:
+                seen_inodes[(st.st_dev, st.st_ino)] = d_path
+            files.append((s_path, d_path, st))
+
+    workers = workers or min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for _ in pool.map(lambda job: _copy_file(*job), files):
+            pass
+
+    for first, link in linked:
+        os.link(first, link)
+
+    # Deepest first, so creating entries does not disturb parents' mtimes
+    for s_dir, d_dir in reversed(dirs):
+        st = os.stat(s_dir)
+        os.chmod(d_dir, stat.S_IMODE(st.st_mode))
+        os.utime(d_dir, ns=(st.st_atime_ns, st.st_mtime_ns))
+        fsync_path(d_dir)
@@ -1,26 +1,64 @@
+import errno
+import json
 import os
-import shutil
 import subprocess
 import time
 import re
 from pathlib import Path
-from libs.path_utils import find_files
+from libs.path_utils import find_files, walk_tree
+from libs.pruning import get_profile, prune_tree, TK_PATTERNS
+from libs.fs_ops import exchange_paths, copy_tree, fsync_path
+from libs.trash import remove_tree
+from libs.progress import StageProgress, default_mode
+from libs import smoke
 
 class InstallAbort(Exception):
     """Controlled installer abort"""
     pass
 
+def version_tuple(version):
+    """(major, minor, micro) of a version string such as 3.12.2 or 3.13.0rc1"""
+    parts = re.findall(r"\d+", version)[:3]
+    return tuple(int(p) for p in parts)
+
 class Installer:
-    def __init__(self, python_source_directory, version):
+    def __init__(
+        self,
+        python_source_directory,
+        version,
+        replace=False,
+        progress=None,
+        build_options=None,
+        build_jobs=None,
+    ):
         self.name = "Python-Installer"
 
         self.version = version
         self.prefix_name = f"python-{version}"
+        # Reinstall: build next to the live prefix and swap at commit
+        self.replace = replace
+        # "bar", "json" (machine-readable lines) or "none"
+        self.progress = progress or default_mode()
+        # Recorded in the prefix so `sevpy sync` can detect option changes
+        self.build_options = build_options
+        self.build_jobs = build_jobs
+        # Whether make altinstall already wrote unchecked-hash pycs
+        self.compiled_unchecked = False
+        # Relative paths of the staged tree, gathered by verify_staging()
+        self.manifest_entries = None
 
         self.source_directory = Path(python_source_directory).resolve()
         self.install_global_dir = Path.home() / ".local" / "opt"
         self.install_version_dir = self.install_global_dir / self.prefix_name
 
+        # Same filesystem as the prefix, so moves between them are renames
+        self.incoming_dir = self.install_global_dir / f".{self.prefix_name}.incoming"
+        self.rollback_dir = self.install_global_dir / ".sevpy-rollback"
+        self.trash_dir = self.install_global_dir / ".sevpy-trash"
+        # Same trash directories as the CLI, for trees outside the install root
+        self.trash_dirs = (self.trash_dir, Path.home() / ".cache" / "sevpy-trash")
+        self.replaced = False
+
         self.staging_dir = (
             Path.home()
             / ".cache"
@@ -66,6 +104,9 @@ class Installer:
             raise InstallAbort("Invalid Python source tree (missing configure)")
 
     def check_prefix_collision(self):
+        if self.replace:
+            return
+
         if self.install_version_dir.exists():
             if self.manifest_path.exists():
                 raise InstallAbort(
@@ -83,30 +124,58 @@ class Installer:
         self.check_writable_dir(self.install_global_dir)
         self.check_prefix_collision()
 
-    def _run_logged(self, cmd, *, cwd, env=None, log_name):
+    def _run_logged(self, cmd, *, cwd, env=None, log_name, check=True):
+        """
+        Run `cmd` with its output teed to the log and the progress display.
+        Returns the exit status; a nonzero one raises InstallAbort unless
+        `check` is False.
+        """
         log_path = self.log_dir / log_name
+        stage = log_name.removesuffix(".log")
+        progress = StageProgress(self.version, stage, self.progress)
+        proc = None
 
         try:
             with open(log_path, "w") as log:
-                subprocess.run(
+                proc = subprocess.Popen(
                     cmd,
                     cwd=cwd,
                     env=env,
-                    stdout=log,
-                    stderr=log,
-                    check=True,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                    errors="replace",
                 )
+                # Tee: everything still goes to the log
+                for line in proc.stdout:
+                    log.write(line)
+                    progress.feed(line)
+
+                if proc.wait() != 0 and check:
+                    raise subprocess.CalledProcessError(proc.returncode, cmd)
         except subprocess.CalledProcessError as e:
+            progress.close(success=False)
             raise InstallAbort(
                 f"Command failed: {' '.join(cmd)}\n"
                 f"See log: {log_path}"
             )
+        except OSError as e:
+            # Missing tool (make, compiler driver), unwritable log, ...
+            progress.close(success=False)
+            raise InstallAbort(f"Cannot run {cmd[0]}: {e}")
         except KeyboardInterrupt:
+            progress.close(success=False)
+            if proc is not None:
+                proc.kill()
+                proc.wait()
             raise InstallAbort(
                 f"Interrupted by user\n"
                 f"Partial log: {log_path}"
             )
 
+        progress.close(success=True)
+        return proc.returncode
+
     def configure(self):
         self.pre_install_step()
 
@@ -139,7 +208,7 @@ class Installer:
 
     def compile(self):
         # Number of parallel jobs
-        jobs = os.cpu_count() or 1
+        jobs = self.build_jobs or os.cpu_count() or 1
 
         print(f"[*] Building with {jobs} parallel jobs...")
         t1 = time.time()
@@ -151,7 +220,31 @@ class Installer:
         t2 = time.time()
         print(f"[+] Build complete in {t2 - t1:.1f} seconds.")
 
-    def staged_install(self, enable_tk=True):
+    def compileall_opts(self, unchecked_hash=False):
+        """
+        Options for libinstall's own compileall run, so that make
+        altinstall compiles the stdlib on every core and in the requested
+        pyc mode. None when this Makefile has no COMPILEALL_OPTS hook
+        (older releases); precompile_bytecode() then recompiles instead.
+        """
+        try:
+            makefile = (self.source_directory / "Makefile").read_text(errors="replace")
+        except OSError:
+            return None
+        if not re.search(r"^COMPILEALL_OPTS\s*=", makefile, re.MULTILINE):
+            return None
+
+        opts = "-j0"
+        if unchecked_hash:
+            opts += " --invalidation-mode unchecked-hash"
+        return opts
+
+    def staged_install(self, precompile=False, unchecked_hash=False):
+        """
+        make altinstall into the staging directory. With `precompile`, its
+        bytecode compile is taken over via COMPILEALL_OPTS where the
+        Makefile allows it.
+        """
         # Ensure build already happened
         # (optional sanity check, not strictly required)
         if not (self.source_directory / "Makefile").exists():
@@ -171,29 +264,215 @@ class Installer:
             )
 
         # ---- make altinstall DESTDIR= ----
+        cmd = ["make", "altinstall", f"DESTDIR={self.staging_dir}"]
+        opts = self.compileall_opts(unchecked_hash) if precompile else None
+        if opts is not None:
+            cmd.append(f"COMPILEALL_OPTS={opts}")
+            self.compiled_unchecked = unchecked_hash
+
         print("[*] Installing to staging directory...")
         self._run_logged(
-            ["make", "altinstall", f"DESTDIR={self.staging_dir}"],
+            cmd,
             cwd=self.source_directory,
             log_name="install.log",
         )
 
-        # Removing the Tkinter Module
-        if not enable_tk:
-            print("[*] Stripping Tk support from staged install...")
+    def smoke_test(self, budget=smoke.DEFAULT_BUDGET, workers=None):
+        """
+        Run a curated subset of the CPython regression suite against the
+        staged interpreter. Must run before pruning removes test/.
+        Raises InstallAbort on any failure, which keeps commit_install()
+        from ever seeing a broken build.
+        """
+        staged_prefix = self.staging_dir / self.install_version_dir.relative_to("/")
+        python_bin = self.find_python_binary(staged_prefix)
+
+        major, minor = self._version_tuple()[:2]
+        test_dir = staged_prefix / "lib" / f"python{major}.{minor}" / "test"
+        names, skipped = smoke.resolve_tests(test_dir, smoke.SMOKE_TESTS)
+        if skipped:
+            print(f"[!] Smoke tests skipped (not in this release): {', '.join(skipped)}")
+        if not names:
+            print("[!] No smoke tests available for this build")
+            return
+        tests = list(names.values())
+
+        missing = smoke.check_imports(python_bin, names)
+        if missing:
+            raise InstallAbort(
+                f"Staged Python cannot import: {', '.join(missing)}\n"
+                f"Check the build log: {self.log_dir / 'build.log'}"
+            )
+
+        key = smoke.build_key(self.version, self.source_directory)
+        cached = set(smoke.load_cache().get(key, []))
+        pending = [t for t in tests if t not in cached]
+
+        if not pending:
+            print("[+] Smoke tests: all passed previously for this build configuration")
+            return
+
+        print(
+            f"[*] Running {len(pending)} smoke tests "
+            f"({len(tests) - len(pending)} cached, budget {budget:.0f}s)..."
+        )
+        t1 = time.time()
+        results = smoke.run_smoke_tests(
+            python_bin,
+            pending,
+            self.log_dir,
+            workers=workers,
+            budget=budget,
+        )
+        t2 = time.time()
 
-            staged_prefix = self.staging_dir / self.install_version_dir.relative_to("/")
+        passed = [t for t, (status, _) in results.items() if status == "passed"]
+        smoke.save_passed(key, passed)
 
-            tk_modules = find_files(
-                staged_prefix,
-                re.compile(r"^_tkinter.*\.so$"),
-                follow_symlinks=False,
+        failed = {t: r for t, r in results.items() if r[0] != "passed"}
+        if failed:
+            lines = [
+                f"  {t}: {status} (log: {self.log_dir / f'smoke-{t}.log'})"
+                for t, (status, _) in failed.items()
+            ]
+            raise InstallAbort(
+                "Smoke tests failed; not committing this build:\n"
+                + "\n".join(lines)
             )
 
-            for tk in tk_modules:
-                print(f"[*] Removing: {tk}")
-                tk.unlink()
+        print(f"[+] Smoke tests passed in {t2 - t1:.1f} seconds.")
+
+    def prune_staging(self, profile=None, enable_tk=True):
+        """
+        Slim the staged install according to an install profile (see
+        libs.pruning.PROFILES). Tk removal for --no-tk is folded into the
+        same pass.
+        """
+        rules = get_profile(profile or "full")
+
+        major, minor = self._version_tuple()[:2]
+        stdlib = f"lib/python{major}.{minor}"
+        patterns = [p.format(stdlib=stdlib) for p in rules["remove"]]
+        if not enable_tk:
+            patterns += TK_PATTERNS
+
+        if not patterns and not rules["strip"]:
+            return
 
+        staged_prefix = self.staging_dir / self.install_version_dir.relative_to("/")
+
+        label = f"'{profile}' profile" if profile else "Tk removal"
+        print(f"[*] Pruning staged install ({label})...")
+        t1 = time.time()
+        try:
+            result = prune_tree(staged_prefix, patterns, strip=rules["strip"])
+        except (OSError, ValueError) as e:
+            raise InstallAbort(f"Pruning failed: {e}")
+        t2 = time.time()
+
+        mib = 1024 * 1024
+        print(
+            f"[+] Pruned {len(result['removed'])} paths, "
+            f"stripped {len(result['stripped'])} binaries in {t2 - t1:.1f} seconds."
+        )
+        print(
+            f"[+] Install size: {result['before'] / mib:.1f} MiB -> "
+            f"{result['after'] / mib:.1f} MiB"
+        )
+
+    def _version_tuple(self):
+        return version_tuple(self.version)
+
+    def precompile_bytecode(self, optimize_levels=(0, 1, 2), unchecked_hash=False):
+        """
+        Bring the staged standard library's bytecode to the requested mode.
+
+        make altinstall has already compiled every level, in parallel and
+        in the requested pyc mode where staged_install() could pass
+        COMPILEALL_OPTS. Only when `unchecked_hash` asks for hash-based
+        pycs that make could not write does the stage recompile (with the
+        staged interpreter, using a process pool across all cores).
+        `optimize_levels` selects which pyc flavours are kept (0 -> .pyc,
+        1 -> .opt-1.pyc, 2 -> .opt-2.pyc); the rest are deleted.
+        """
+        staged_prefix = self.staging_dir / self.install_version_dir.relative_to("/")
+
+        major, minor = self._version_tuple()[:2]
+        lib_name = f"python{major}.{minor}"
+        staged_lib = staged_prefix / "lib" / lib_name
+        final_lib = self.install_version_dir / "lib" / lib_name
+
+        if not staged_lib.is_dir():
+            raise InstallAbort(f"Staged stdlib not found: {staged_lib}")
+
+        levels = sorted(set(optimize_levels))
+        if not levels or any(level not in (0, 1, 2) for level in levels):
+            raise InstallAbort(f"Invalid optimization levels: {optimize_levels}")
+
+        if unchecked_hash and (major, minor) < (3, 7):
+            raise InstallAbort("Unchecked-hash pycs require Python 3.7+")
+
+        if levels == [0, 1, 2] and (not unchecked_hash or self.compiled_unchecked):
+            print("[+] Bytecode: make altinstall already wrote the requested pycs")
+            return
+
+        t1 = time.time()
+
+        if unchecked_hash and not self.compiled_unchecked:
+            python_bin = self.find_python_binary(staged_prefix)
+
+            # Same exclusions as CPython's own libinstall target
+            base = [
+                "-m", "compileall", "-q", "-f", "-j0",
+                "-d", str(final_lib),
+                "-x", "bad_coding|badsyntax|site-packages|lib2to3/tests/data",
+                "--invalidation-mode", "unchecked-hash",
+            ]
+
+            if (major, minor) >= (3, 9):
+                opts = []
+                for level in levels:
+                    opts += ["-o", str(level)]
+                commands = [[str(python_bin), "-Wi", *base, *opts, str(staged_lib)]]
+            else:
+                # No -o before 3.9: one pass per level with -O / -OO
+                commands = [
+                    [str(python_bin), "-Wi", *(["-O"] * level), *base, str(staged_lib)]
+                    for level in levels
+                ]
+
+            print(
+                "[*] Recompiling bytecode as unchecked-hash pycs "
+                f"(levels: {', '.join(map(str, levels))})..."
+            )
+            for i, cmd in enumerate(commands):
+                log_name = f"precompile-{i}.log"
+                # Like the Makefile's `-$(PYTHON_FOR_BUILD) -m compileall`:
+                # files that do not compile (test data, ...) are not fatal
+                if self._run_logged(cmd, cwd=staged_lib, log_name=log_name, check=False):
+                    print(
+                        "[!] compileall reported errors (ignored); "
+                        f"see log: {self.log_dir / log_name}"
+                    )
+        else:
+            print(f"[*] Keeping pyc levels: {', '.join(map(str, levels))}...")
+
+        # Drop the levels make altinstall wrote but were not asked for
+        if (major, minor) >= (3, 5):
+            patterns = [rf"\.opt-{level}\.pyc$" for level in (1, 2) if level not in levels]
+            if 0 not in levels:
+                patterns.append(r"\.cpython-\d+\.pyc$")
+        else:
+            # -O and -OO both write .pyo before 3.5
+            patterns = [] if {1, 2} & set(levels) else [r"\.pyo$"]
+            if 0 not in levels:
+                patterns.append(r"\.pyc$")
+        if patterns:
+            for pyc in find_files(staged_lib, re.compile("|".join(patterns))):
+                pyc.unlink()
+
+        t2 = time.time()
+        print(f"[+] Bytecode ready in {t2 - t1:.1f} seconds.")
 
     def find_python_binary(self, staged_prefix):
         bin_dir = staged_prefix / "bin"
@@ -240,30 +519,80 @@ class Installer:
         python_bin = self.find_python_binary(staged_prefix)
         print(f"[+] Verified staged Python: {python_bin}")
 
-        # Containment & symlink safety
-        for path in staged_prefix.rglob("*"):
-            try:
-                resolved = path.resolve()
-            except FileNotFoundError:
-                raise InstallAbort(f"Broken symlink: {path}")
-
-            if not str(resolved).startswith(str(staged_prefix)):
-                raise InstallAbort(
-                    f"Path escapes install prefix: {path} → {resolved}"
-                )
-
-    def write_manifest(self):
+        # Containment & symlink safety, collecting the manifest in the
+        # same walk. Symlinked directories are not descended into, so only
+        # symlinks themselves can point outside the prefix.
+        root = os.path.realpath(staged_prefix)
         entries = []
 
-        for path in self.install_version_dir.rglob("*"):
-            if path.is_file() or path.is_symlink():
-                entries.append(str(path))
+        for entry in walk_tree(root):
+            if entry.is_symlink():
+                resolved = os.path.realpath(entry.path)
+                if not os.path.exists(resolved):
+                    raise InstallAbort(f"Broken symlink: {entry.path}")
+
+                if resolved != root and not resolved.startswith(root + os.sep):
+                    raise InstallAbort(
+                        f"Path escapes install prefix: {entry.path} → {resolved}"
+                    )
+                entries.append(entry.path[len(root) + 1:])
+            elif entry.is_file(follow_symlinks=False):
+                entries.append(entry.path[len(root) + 1:])
+
+        self.manifest_entries = sorted(entries)
+
+    def write_manifest(self, root):
+        """
+        Write the manifest into the tree at `root` (the staged prefix),
+        listing paths as they will appear under the install prefix.
+        Reuses the listing gathered by verify_staging() when available.
+        """
+        if self.manifest_entries is None:
+            self.manifest_entries = sorted(
+                entry.path[len(str(root)) + 1:]
+                for entry in walk_tree(root)
+                if entry.is_symlink() or entry.is_file(follow_symlinks=False)
+            )
+
+        entries = [str(self.install_version_dir / rel) for rel in self.manifest_entries]
 
         try:
-            self.manifest_path.write_text("\n".join(entries) + "\n")
+            (root / self.manifest_path.name).write_text("\n".join(entries) + "\n")
         except Exception as e:
             raise InstallAbort(f"Failed to write manifest: {e}")
 
+    def write_build_options(self, root):
+        try:
+            (root / ".build-options").write_text(json.dumps(self.build_options, indent=1) + "\n")
+        except Exception as e:
+            raise InstallAbort(f"Failed to write build options: {e}")
+
+    def keep_for_rollback(self, previous):
+        """Park a replaced prefix so `sevpy rollback` can swap it back."""
+        target = self.rollback_dir / self.prefix_name
+
+        self.rollback_dir.mkdir(parents=True, exist_ok=True)
+        if target.exists():
+            remove_tree(target, [self.trash_dir])
+        previous.rename(target)
+
+    def copy_across_devices(self, staged_prefix):
+        """
+        The staging area lives on another filesystem (separate /home cache
+        volume, tmpfs, ...): copy the tree next to the prefix so the final
+        step is still an atomic rename on the install filesystem.
+        """
+        print("[*] Staging area is on another filesystem; copying staged install...")
+        t1 = time.time()
+        try:
+            copy_tree(staged_prefix, self.incoming_dir)
+        except BaseException:
+            if self.incoming_dir.exists():
+                remove_tree(self.incoming_dir, [self.trash_dir])
+            raise
+        t2 = time.time()
+        print(f"[+] Copied in {t2 - t1:.1f} seconds.")
+
     def commit_install(self):
         # Path to staged prefix inside DESTDIR
         staged_prefix = self.staging_dir / self.install_version_dir.relative_to("/")
@@ -271,25 +600,67 @@ class Installer:
         if not staged_prefix.exists():
             raise InstallAbort("Nothing to commit: staged prefix missing")
 
-        if self.install_version_dir.exists():
+        if self.install_version_dir.exists() and not self.replace:
             raise InstallAbort(
                 f"Install prefix already exists: {self.install_version_dir}"
             )
 
+        # ---- Write manifest ----
+        # Before the move, so the tree is complete the moment it goes live
+        self.write_manifest(staged_prefix)
+        if self.build_options is not None:
+            self.write_build_options(staged_prefix)
+
         try:
             # Ensure parent exists
             self.install_version_dir.parent.mkdir(parents=True, exist_ok=True)
 
-            # Atomic move
-            staged_prefix.rename(self.install_version_dir)
+            # Leftover from an interrupted commit
+            if self.incoming_dir.exists():
+                remove_tree(self.incoming_dir, [self.trash_dir])
+
+            # Bring the new tree onto the install filesystem
+            try:
+                staged_prefix.rename(self.incoming_dir)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                self.copy_across_devices(staged_prefix)
+
+            swapped = self.install_version_dir.exists()
+            if swapped:
+                # Atomic swap: the prefix always holds a complete install
+                if not exchange_paths(self.incoming_dir, self.install_version_dir):
+                    print("[!] Atomic exchange unsupported here; swapped with plain renames")
+            else:
+                # Atomic move
+                self.incoming_dir.rename(self.install_version_dir)
         except Exception as e:
             raise InstallAbort(f"Commit failed: {e}")
 
-        # ---- Write manifest ----
-        self.write_manifest()
+        # Make the rename itself survive a crash, not just the tree's data
+        try:
+            fsync_path(self.install_global_dir)
+        except OSError as e:
+            print(f"[!] Could not fsync {self.install_global_dir}: {e}")
+
+        # The new build is live from here on; failing to park the old one
+        # only costs the rollback
+        if swapped:
+            try:
+                self.keep_for_rollback(self.incoming_dir)
+                self.replaced = True
+            except Exception as e:
+                print(f"[!] Could not keep the previous build for rollback: {e}")
+                print(f"[!] It was left at {self.incoming_dir}")
 
         # ---- Cleanup staging ----
-        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        # After a cross-device copy the whole staged tree is still here;
+        # trash it rather than deleting it inline
+        try:
+            remove_tree(self.staging_dir, self.trash_dirs)
+        except OSError as e:
+            print(f"[!] Could not remove staging directory {self.staging_dir}: {e}")
 
     def final_thing(self):
         bin_path = self.install_version_dir / "bin"
@@ -299,3 +670,8 @@ class Installer:
             f'export PATH="{bin_path}:$PATH"\n\n'
             "This does NOT replace the system Python."
         )
+        if self.replaced:
+            print(
+                "\nThe previous build was kept. To restore it:\n\n"
+                f"sevpy rollback {self.version}"
+            )
@@ -1,6 +1,78 @@
+import os
 from pathlib import Path
 import re
-from typing import Iterable, Union, Pattern
+from typing import Callable, Iterable, Optional, Union, Pattern
+
+
+def _scan(path: str) -> list[os.DirEntry]:
+    try:
+        with os.scandir(path) as it:
+            return list(it)
+    except OSError:
+        # Permission denied / vanished while walking
+        return []
+
+
+def walk_tree(
+    root: Union[str, Path],
+    *,
+    follow_symlinks: bool = False,
+    prune: Optional[Callable[[os.DirEntry], bool]] = None,
+) -> list[os.DirEntry]:
+    """
+    Collect every entry below `root` using os.scandir.
+
+    The returned DirEntry objects carry the file type from the directory
+    listing, so is_dir()/is_file()/is_symlink() cost no extra syscalls and
+    stat() is cached after the first call. A directory's entry always
+    comes before its contents, so callers can process the list in order
+    (e.g. create directories before copying files into them).
+
+    Parameters
+    ----------
+    root : str | Path
+        Directory to walk. Not included in the result.
+    follow_symlinks : bool
+        Descend into symlinked directories (each directory is visited
+        once, so link cycles are safe).
+    prune : callable, optional
+        Called with each directory entry; returning True keeps the walk
+        out of it. The entry itself is still returned.
+
+    Returns
+    -------
+    list[os.DirEntry]
+        All entries found.
+    """
+    root = os.fspath(root)
+    results: list[os.DirEntry] = []
+    seen = set()
+
+    def descend(entry: os.DirEntry) -> bool:
+        try:
+            if not entry.is_dir(follow_symlinks=follow_symlinks):
+                return False
+            if follow_symlinks:
+                st = entry.stat()
+                if (st.st_dev, st.st_ino) in seen:
+                    return False
+                seen.add((st.st_dev, st.st_ino))
+        except OSError:
+            return False
+        return not (prune and prune(entry))
+
+    if follow_symlinks:
+        st = os.stat(root)
+        seen.add((st.st_dev, st.st_ino))
+
+    stack = [root]
+    while stack:
+        for entry in _scan(stack.pop()):
+            results.append(entry)
+            if descend(entry):
+                stack.append(entry.path)
+
+    return results
 
 
 def find_files(
@@ -36,16 +108,20 @@ def find_files(
 
     results: list[Path] = []
 
-    for path in search_dir.rglob("*"):
+    for entry in walk_tree(search_dir, follow_symlinks=follow_symlinks):
+        # Cheap name test first: file type checks may need a stat
+        if not regex.search(entry.name):
+            continue
+
         try:
-            if not follow_symlinks and path.is_symlink():
+            if not follow_symlinks and entry.is_symlink():
                 continue
 
-            if path.is_file() and regex.search(path.name):
-                results.append(path)
+            if entry.is_file(follow_symlinks=follow_symlinks):
+                results.append(Path(entry.path))
 
         except OSError:
-            # Permission denied / broken symlink / race condition
+            # Broken symlink / race condition
             continue
 
     return results
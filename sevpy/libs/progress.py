@@ -0,0 +1,150 @@
+import json
+import platform
+import re
+import sys
+import time
+from pathlib import Path
+
+from libs.state_file import load_json, update_json
+
+# Kept outside ~/.cache/sevpy so that `sevpy clean` does not forget it
+HISTORY_PATH = Path.home() / ".local" / "share" / "sevpy" / "build-history.json"
+
+# What counts as one unit of work in each stage's output. Stages not
+# listed here count every output line.
+UNIT_PATTERNS = {
+    "configure": re.compile(r"^checking "),
+    "build": re.compile(r"(^|\s)-c\s"),  # compiler invocations
+}
+
+PROGRESS_MODES = ("bar", "json", "none")
+
+# Minimum seconds between machine-readable progress lines
+JSON_INTERVAL = 0.5
+
+
+def _history_key(version: str, stage: str) -> str:
+    return f"{platform.node()}:{version}:{stage}"
+
+
+def load_history() -> dict:
+    return load_json(HISTORY_PATH)
+
+
+def record_history(version: str, stage: str, units: int, seconds: float):
+    def record(history):
+        history[_history_key(version, stage)] = {
+            "units": units,
+            "seconds": round(seconds, 1),
+        }
+
+    update_json(HISTORY_PATH, record)
+
+
+def _fmt_eta(seconds) -> str:
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+class StageProgress:
+    """
+    Counts units of work in a stage's output and reports progress as a
+    progress bar or as JSON lines, with an ETA based on the last run of
+    the same stage for the same version on this host. Both go to stderr,
+    keeping JSON lines apart from the installer's messages on stdout.
+    """
+
+    def __init__(self, version: str, stage: str, mode: str = "bar"):
+        self.version = version
+        self.stage = stage
+        self.mode = mode
+        self.pattern = UNIT_PATTERNS.get(stage)
+
+        previous = load_history().get(_history_key(version, stage), {})
+        self.expected_units = previous.get("units")
+        self.expected_seconds = previous.get("seconds")
+
+        self.units = 0
+        self.started = time.time()
+        self._last_emit = 0.0
+        self._bar = None
+
+        if mode == "bar":
+            from tqdm import tqdm
+
+            if self.expected_units:
+                fmt = "{desc}: {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt} [{elapsed}, ETA {postfix}]"
+            else:
+                fmt = "{desc}: {n_fmt} units [{elapsed}]"
+            self._bar = tqdm(
+                total=self.expected_units,
+                desc=f"    {stage}",
+                bar_format=fmt,
+                leave=False,
+            )
+
+    def eta(self):
+        elapsed = time.time() - self.started
+
+        if self.expected_units:
+            fraction = min(self.units / self.expected_units, 0.99)
+            if self.expected_seconds:
+                return max(self.expected_seconds * (1 - fraction), 0)
+            if fraction > 0:
+                return elapsed * (1 / fraction - 1)
+            return None
+
+        if self.expected_seconds:
+            return max(self.expected_seconds - elapsed, 0)
+        return None
+
+    def feed(self, line: str):
+        if self.pattern is not None and not self.pattern.search(line):
+            return
+        self.units += 1
+
+        if self._bar is not None:
+            if self.expected_units and self._bar.n >= self.expected_units:
+                # More work than last time; hold at the end
+                self._bar.set_postfix_str(_fmt_eta(0), refresh=False)
+            else:
+                self._bar.set_postfix_str(_fmt_eta(self.eta()), refresh=False)
+                self._bar.update(1)
+        elif self.mode == "json":
+            now = time.time()
+            if now - self._last_emit >= JSON_INTERVAL:
+                self._last_emit = now
+                self._emit("progress")
+
+    def _emit(self, event: str):
+        elapsed = time.time() - self.started
+        eta = self.eta() if event == "progress" else 0
+        print(json.dumps({
+            "event": event,
+            "version": self.version,
+            "stage": self.stage,
+            "done": self.units,
+            "total": self.expected_units,
+            "elapsed": round(elapsed, 1),
+            "eta": None if eta is None else round(eta, 1),
+        }), file=sys.stderr, flush=True)
+
+    def close(self, success: bool):
+        if self._bar is not None:
+            self._bar.close()
+        elif self.mode == "json":
+            self._emit("done" if success else "failed")
+
+        if success:
+            record_history(
+                self.version,
+                self.stage,
+                self.units,
+                time.time() - self.started,
+            )
+
+
+def default_mode() -> str:
+    return "bar" if sys.stdout.isatty() else "none"
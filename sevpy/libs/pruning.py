@@ -0,0 +1,175 @@
+import fnmatch
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from libs.path_utils import walk_tree
+
+# Install profiles.
+#
+# `remove` holds glob patterns matched against paths relative to the install
+# prefix; `{stdlib}` expands to lib/pythonX.Y. Matching directories are
+# dropped whole. Nothing below site-packages is ever removed.
+PROFILES = {
+    "full": {
+        "strip": False,
+        "remove": (),
+    },
+    "server": {
+        "strip": True,
+        "remove": (
+            "{stdlib}/test",
+            "{stdlib}/*/test",
+            "{stdlib}/*/tests",
+            "{stdlib}/idlelib",
+            "{stdlib}/turtledemo",
+            "bin/idle*",
+            "*.a",
+        ),
+    },
+    "minimal": {
+        "strip": True,
+        "remove": (
+            "{stdlib}/test",
+            "{stdlib}/*/test",
+            "{stdlib}/*/tests",
+            "{stdlib}/idlelib",
+            "{stdlib}/turtledemo",
+            "{stdlib}/ensurepip/_bundled",
+            "bin/idle*",
+            "*.a",
+        ),
+    },
+}
+
+TK_PATTERNS = ("*/_tkinter*.so",)
+
+ELF_MAGIC = b"\x7fELF"
+
+
+def get_profile(name: str) -> dict:
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown install profile: {name} "
+            f"(available: {', '.join(PROFILES)})"
+        )
+
+
+def _is_elf(path: Path) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(4) == ELF_MAGIC
+    except OSError:
+        return False
+
+
+def prune_tree(
+    prefix: Path,
+    patterns,
+    *,
+    strip: bool = False,
+    protect: str = "site-packages",
+    workers: int = None,
+) -> dict:
+    """
+    Apply removal patterns and debug-symbol stripping to an install tree
+    in a single walk, then carry out the work in a thread pool.
+
+    Returns a dict with `before`, `after` (bytes), `removed` (list of
+    removed paths) and `stripped` (list of stripped files).
+    """
+    prefix = Path(prefix)
+    if not prefix.is_dir():
+        raise ValueError(f"Not a directory: {prefix}")
+
+    strip_tool = shutil.which("strip") if strip else None
+    if strip and strip_tool is None:
+        print("[!] 'strip' not found — skipping debug symbol stripping")
+
+    before = 0
+    removed_bytes = 0
+    remove_dirs: list[Path] = []
+    remove_files: list[Path] = []
+    strip_targets: list[Path] = []
+
+    root = str(prefix)
+    # Directories (relative) that are being dropped or are protected.
+    # Parents are always listed before their contents, so membership of
+    # the parent decides for each entry.
+    dropped = set()
+    protected = set()
+
+    def matches(rel: str) -> bool:
+        return any(fnmatch.fnmatchcase(rel, p) for p in patterns)
+
+    for entry in walk_tree(prefix):
+        rel = entry.path[len(root) + 1:]
+        parent = os.path.dirname(rel)
+        inside_dropped = parent in dropped
+        is_protected = parent in protected or entry.name == protect
+
+        if entry.is_dir(follow_symlinks=False):
+            if inside_dropped:
+                dropped.add(rel)
+            elif is_protected:
+                protected.add(rel)
+            elif matches(rel):
+                dropped.add(rel)
+                remove_dirs.append(Path(entry.path))
+            continue
+
+        try:
+            size = entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            continue
+        before += size
+
+        if inside_dropped:
+            removed_bytes += size
+            continue
+
+        if not is_protected and matches(rel):
+            removed_bytes += size
+            remove_files.append(Path(entry.path))
+            continue
+
+        if (
+            strip_tool
+            and not entry.is_symlink()
+            and (entry.name.endswith(".so") or parent == "bin")
+            and _is_elf(Path(entry.path))
+        ):
+            strip_targets.append(Path(entry.path))
+
+    def strip_one(path: Path) -> int:
+        old = path.stat().st_size
+        try:
+            subprocess.run(
+                [strip_tool, "--strip-debug", str(path)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                check=True,
+            )
+        except subprocess.CalledProcessError:
+            # Not every ELF object is strippable; leave it untouched
+            return 0
+        return old - path.stat().st_size
+
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for _ in pool.map(shutil.rmtree, remove_dirs):
+            pass
+        for _ in pool.map(os.unlink, remove_files):
+            pass
+        saved = sum(pool.map(strip_one, strip_targets))
+
+    return {
+        "before": before,
+        "after": before - removed_bytes - saved,
+        "removed": remove_dirs + remove_files,
+        "stripped": strip_targets,
+    }
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from libs.state_file import load_json, update_json
+
+CACHE_PATH = Path.home() / ".local" / "share" / "sevpy" / "smoke-cache.json"
+
+# Curated regression tests, each with the modules it exercises. The
+# imports are checked up front because regrtest reports a test whose
+# extension module failed to build as "skipped", not failed.
+SMOKE_TESTS = {
+    "test_ssl": ("ssl",),
+    "test_hashlib": ("hashlib", "_hashlib"),
+    "test_sqlite3": ("sqlite3",),
+    "test_ctypes": ("ctypes",),
+    "test_zlib": ("zlib",),
+    "test_bz2": ("bz2",),
+    "test_lzma": ("lzma",),
+    "test_decimal": ("decimal", "_decimal"),
+    "test_json": ("json", "_json"),
+    "test_datetime": ("datetime",),
+}
+
+# Names a curated test had in older releases
+OLD_NAMES = {
+    "test_sqlite3": ("test_sqlite",),  # renamed in 3.11
+}
+
+DEFAULT_BUDGET = 600
+
+
+def resolve_tests(test_dir: Path, tests) -> tuple[dict, list[str]]:
+    """
+    Find the name each curated test has in the staged `test_dir`.
+
+    regrtest fails the whole run on an unknown test name, so tests this
+    release does not have (test_lzma on 2.7, ...) are left out. Returns
+    ({curated name: name in this release}, [skipped curated names]).
+    """
+    found, skipped = {}, []
+    for test in tests:
+        for name in (test, *OLD_NAMES.get(test, ())):
+            if (test_dir / f"{name}.py").is_file() or (test_dir / name).is_dir():
+                found[test] = name
+                break
+        else:
+            skipped.append(test)
+    return found, skipped
+
+
+def build_key(version: str, source_directory: Path) -> str:
+    """
+    Identify a build by version plus the configure results (Makefile and
+    pyconfig.h), so a rebuild with the same options and libraries reuses
+    earlier passes.
+    """
+    h = hashlib.sha256(version.encode())
+    for name in ("Makefile", "pyconfig.h"):
+        try:
+            h.update((source_directory / name).read_bytes())
+        except OSError:
+            h.update(b"\0")
+    return h.hexdigest()
+
+
+def load_cache() -> dict:
+    return load_json(CACHE_PATH)
+
+
+def save_passed(key: str, passed):
+    def add(cache):
+        cache[key] = sorted(set(cache.get(key, [])) | set(passed))
+
+    update_json(CACHE_PATH, add)
+
+
+def _clean_env() -> dict:
+    env = dict(os.environ)
+    for var in ("PYTHONPATH", "PYTHONHOME", "PYTHONSTARTUP"):
+        env.pop(var, None)
+    return env
+
+
+# Prints every module that fails to import; valid Python 2 and 3
+_IMPORT_CHECK = (
+    "import importlib, sys\n"
+    "for name in sys.argv[1:]:\n"
+    "    try:\n"
+    "        importlib.import_module(name)\n"
+    "    except Exception:\n"
+    "        print(name)\n"
+)
+
+
+def check_imports(python: Path, tests) -> list[str]:
+    """Return the modules required by `tests` that fail to import."""
+    modules = sorted({m for t in tests for m in SMOKE_TESTS.get(t, ())})
+
+    result = subprocess.run(
+        [str(python), "-c", _IMPORT_CHECK, *modules],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        env=_clean_env(),
+    )
+    if result.returncode != 0:
+        return modules
+    return result.stdout.split()
+
+
+def run_smoke_tests(
+    python: Path,
+    tests,
+    log_dir: Path,
+    *,
+    workers: int = None,
+    budget: float = DEFAULT_BUDGET,
+) -> dict:
+    """
+    Run each regression test module in its own interpreter, sharded over
+    a pool of workers, within an overall time budget.
+
+    Returns {test: (status, seconds)} where status is "passed", "failed"
+    or "timeout".
+    """
+    deadline = time.monotonic() + budget
+    env = _clean_env()
+
+    def run_one(test):
+        started = time.monotonic()
+        remaining = deadline - started
+        if remaining <= 0:
+            return test, ("timeout", 0.0)
+
+        log_path = log_dir / f"smoke-{test}.log"
+        try:
+            with open(log_path, "w") as log:
+                result = subprocess.run(
+                    [str(python), "-m", "test.regrtest", test],
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                    env=env,
+                    timeout=remaining,
+                )
+            status = "passed" if result.returncode == 0 else "failed"
+        except subprocess.TimeoutExpired:
+            status = "timeout"
+
+        return test, (status, time.monotonic() - started)
+
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(run_one, tests))
@@ -0,0 +1,41 @@
+import fcntl
+import json
+import os
+import threading
+from pathlib import Path
+
+# `sevpy sync` runs several installs in threads of one process
+_lock = threading.Lock()
+
+
+def load_json(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def update_json(path: Path, update):
+    """
+    Read-modify-write a small JSON state file (build history, smoke test
+    cache) by calling `update` on its contents.
+
+    Writers are serialised by a thread lock plus flock() on a sidecar
+    lock file, and each writes its own temporary file before the atomic
+    replace, so concurrent builds neither interleave writes nor lose each
+    other's entries. Errors are ignored: the state is only a cache.
+    """
+    with _lock:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path.with_name(f"{path.name}.lock"), "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+                data = load_json(path)
+                update(data)
+
+                tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp.write_text(json.dumps(data, indent=1))
+                tmp.replace(path)
+        except OSError:
+            pass
@@ -0,0 +1,217 @@
+import json
+import os
+from pathlib import Path
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python < 3.11
+    import tomli as tomllib
+
+from libs.dispatch import build_index
+from libs.installer import version_tuple
+from libs.pruning import PROFILES
+
+LOCK_NAME = "sevpy.toml"
+BUILD_OPTIONS_NAME = ".build-options"
+MANIFEST_NAME = ".install-manifest"
+
+# Lock file key -> install() keyword argument
+ENTRY_KEYS = {
+    "tk": "enable_tkinter",
+    "profile": "profile",
+    "precompile": "precompile",
+    "pyc_levels": "pyc_levels",
+    "unchecked_hash": "unchecked_hash",
+    "smoke_test": "smoke_test",
+    "smoke_budget": "smoke_budget",
+}
+
+# Lock file key -> expected TOML type, for error messages and checks
+ENTRY_TYPES = {
+    "tk": (bool, "a boolean"),
+    "profile": (str, "a string"),
+    "precompile": (bool, "a boolean"),
+    "pyc_levels": (list, "a list of 0, 1, 2"),
+    "unchecked_hash": (bool, "a boolean"),
+    "smoke_test": (bool, "a boolean"),
+    "smoke_budget": ((int, float), "a positive number of seconds"),
+}
+
+SYNC_DEFAULTS = {
+    # Removing unlisted installs must be asked for explicitly
+    "remove_unlisted": False,
+    "jobs": 2,
+}
+
+
+class LockError(Exception):
+    """Invalid or unreadable lock file"""
+    pass
+
+
+def normalize_build_options(
+    enable_tkinter=True,
+    profile=None,
+    precompile=False,
+    pyc_levels=(0, 1, 2),
+    unchecked_hash=False,
+    **_,
+) -> dict:
+    """
+    The options that change what ends up in the prefix, in the form
+    recorded in <prefix>/.build-options. Options that only affect the
+    build process (progress, smoke tests) are left out, and so is a
+    precompile stage that yields the default pycs, so that options
+    producing the same tree compare equal.
+    """
+    levels = sorted(set(pyc_levels))
+    unchecked_hash = bool(unchecked_hash) if precompile else False
+    if precompile and levels == [0, 1, 2] and not unchecked_hash:
+        precompile = False
+
+    return {
+        "tk": bool(enable_tkinter),
+        "profile": profile or "full",
+        "precompile": bool(precompile),
+        "pyc_levels": levels if precompile else None,
+        "unchecked_hash": unchecked_hash,
+    }
+
+
+def read_build_options(prefix: Path) -> dict:
+    """Options a prefix was built with; defaults for older installs."""
+    try:
+        recorded = json.loads((prefix / BUILD_OPTIONS_NAME).read_text())
+        # Re-normalized, so records written by older sevpy versions compare
+        return normalize_build_options(
+            enable_tkinter=recorded["tk"],
+            profile=recorded["profile"],
+            precompile=recorded["precompile"],
+            pyc_levels=recorded["pyc_levels"] or (0, 1, 2),
+            unchecked_hash=recorded["unchecked_hash"],
+        )
+    except (OSError, ValueError, KeyError, TypeError):
+        return normalize_build_options()
+
+
+def _entry_to_kwargs(version: str, entry: dict) -> dict:
+    unknown = set(entry) - set(ENTRY_KEYS)
+    if unknown:
+        raise LockError(f"python.\"{version}\": unknown keys: {', '.join(sorted(unknown))}")
+
+    for key, value in entry.items():
+        types, expected = ENTRY_TYPES[key]
+        # bool is an int subclass: `smoke_budget = true` is not a number
+        if not isinstance(value, types) or (types is not bool and isinstance(value, bool)):
+            raise LockError(f"python.\"{version}\": {key} must be {expected}")
+
+    kwargs = {ENTRY_KEYS[k]: v for k, v in entry.items()}
+
+    profile = kwargs.get("profile")
+    if profile is not None and profile not in PROFILES:
+        raise LockError(f"python.\"{version}\": unknown profile: {profile}")
+
+    levels = kwargs.get("pyc_levels")
+    if levels is not None:
+        if not levels or any(type(l) is not int or l not in (0, 1, 2) for l in levels):
+            raise LockError(f"python.\"{version}\": pyc_levels must be a list of 0, 1, 2")
+        kwargs["pyc_levels"] = tuple(levels)
+        kwargs["precompile"] = True
+    if kwargs.get("unchecked_hash"):
+        if version_tuple(version)[:2] < (3, 7):
+            raise LockError(f"python.\"{version}\": unchecked_hash requires Python 3.7+")
+        kwargs["precompile"] = True
+    if "smoke_budget" in kwargs:
+        if kwargs["smoke_budget"] <= 0:
+            raise LockError(f"python.\"{version}\": smoke_budget must be a positive number of seconds")
+        kwargs["smoke_test"] = True
+
+    return kwargs
+
+
+def load_lock(path: Path) -> tuple[dict, dict]:
+    """
+    Parse a lock file:
+
+        [sync]
+        remove_unlisted = true   # remove managed versions not listed (default: false)
+        jobs = 2                 # builds run concurrently
+
+        [python."3.12.2"]
+        tk = false
+        profile = "server"
+
+    Returns (settings, {version: install kwargs}).
+    """
+    try:
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    except OSError as e:
+        raise LockError(f"Cannot read {path}: {e}")
+    except tomllib.TOMLDecodeError as e:
+        raise LockError(f"Invalid TOML in {path}: {e}")
+
+    unknown = set(data) - {"sync", "python"}
+    if unknown:
+        raise LockError(f"Unknown sections: {', '.join(sorted(unknown))}")
+
+    settings = dict(SYNC_DEFAULTS)
+    settings.update(data.get("sync", {}))
+    unknown = set(settings) - set(SYNC_DEFAULTS)
+    if unknown:
+        raise LockError(f"sync: unknown keys: {', '.join(sorted(unknown))}")
+    if type(settings["jobs"]) is not int or settings["jobs"] < 1:
+        raise LockError("sync.jobs must be a positive integer")
+    if not isinstance(settings["remove_unlisted"], bool):
+        raise LockError("sync.remove_unlisted must be a boolean")
+
+    versions = {}
+    for version, entry in data.get("python", {}).items():
+        if not isinstance(entry, dict):
+            raise LockError(f"python.\"{version}\" must be a table")
+        versions[version] = _entry_to_kwargs(version, entry)
+
+    return settings, versions
+
+
+def plan_sync(settings: dict, desired: dict, install_root: Path) -> dict:
+    """
+    Diff the lock against the install root without running any
+    interpreter. Returns {"install": [...], "rebuild": [...],
+    "remove": [...], "conflict": [...], "ok": [...]} (lists of versions).
+    A conflict is a listed version whose prefix sevpy did not install;
+    it is left alone.
+    """
+    valid = build_index(str(install_root))
+
+    present = {}
+    try:
+        for entry in os.scandir(install_root):
+            if entry.name.startswith("python-") and entry.is_dir():
+                present[entry.name.removeprefix("python-")] = Path(entry.path)
+    except OSError:
+        pass
+
+    plan = {"install": [], "rebuild": [], "remove": [], "conflict": [], "ok": []}
+
+    for version, kwargs in desired.items():
+        if version not in present:
+            plan["install"].append(version)
+        elif not (present[version] / MANIFEST_NAME).exists():
+            # Never build over directories sevpy did not install
+            plan["conflict"].append(version)
+        elif version not in valid:
+            # Managed but broken
+            plan["rebuild"].append(version)
+        elif read_build_options(present[version]) != normalize_build_options(**kwargs):
+            plan["rebuild"].append(version)
+        else:
+            plan["ok"].append(version)
+
+    if settings["remove_unlisted"]:
+        for version, prefix in present.items():
+            # Never touch directories sevpy did not install
+            if version not in desired and (prefix / MANIFEST_NAME).exists():
+                plan["remove"].append(version)
+
+    return plan
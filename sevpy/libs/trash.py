@@ -0,0 +1,230 @@
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+# Entries being deleted are renamed to `.reaping-<pid>-<name>` so that
+# concurrent reapers never work on the same tree.
+REAPING_PREFIX = ".reaping-"
+
+
+def _same_device(a: Path, b: Path) -> bool:
+    try:
+        return os.stat(a).st_dev == os.lstat(b).st_dev
+    except OSError:
+        return False
+
+
+def move_to_trash(target: Path, trash_dirs) -> Optional[Path]:
+    """
+    Atomically rename `target` into the first trash directory that lives
+    on the same filesystem.
+
+    Returns the trashed path, or None when no trash directory shares a
+    filesystem with `target` (the caller should delete it directly).
+    """
+    target = Path(target)
+
+    for trash_dir in trash_dirs:
+        trash_dir = Path(trash_dir)
+        try:
+            trash_dir.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            continue
+
+        if not _same_device(trash_dir, target):
+            continue
+
+        dest = trash_dir / f"{target.name}.{time.time_ns()}"
+        try:
+            target.rename(dest)
+        except OSError:
+            # EXDEV on bind mounts, EBUSY on mount points, ...
+            continue
+        return dest
+
+    return None
+
+
+def remove_tree(target: Path, trash_dirs) -> bool:
+    """
+    Remove a directory tree, preferring an instant move to the trash.
+
+    Returns True if the tree was trashed (space is reclaimed later) and
+    False if it had to be deleted synchronously.
+    """
+    if move_to_trash(target, trash_dirs) is not None:
+        return True
+
+    shutil.rmtree(target)
+    return False
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _owned_by_live_reaper(name: str) -> bool:
+    if not name.startswith(REAPING_PREFIX):
+        return False
+    owner = name[len(REAPING_PREFIX):].partition("-")[0]
+    return not owner.isdigit() or _pid_alive(int(owner))
+
+
+def _claim(trash_dir: Path) -> list[Path]:
+    claimed = []
+    me = os.getpid()
+
+    try:
+        entries = list(os.scandir(trash_dir))
+    except OSError:
+        return claimed
+
+    for entry in entries:
+        name = entry.name
+
+        if name.startswith(REAPING_PREFIX):
+            # Only take over what a reaper that died half-way left behind
+            if _owned_by_live_reaper(name):
+                continue
+            name = name[len(REAPING_PREFIX):].partition("-")[2]
+
+        dest = trash_dir / f"{REAPING_PREFIX}{me}-{name}"
+        try:
+            os.rename(entry.path, dest)
+        except OSError:
+            # Another reaper got there first
+            continue
+        claimed.append(dest)
+
+    return claimed
+
+
+def _remove_any(path: str):
+    try:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.unlink(path)
+    except OSError:
+        pass
+
+
+def _fan_out(root: Path) -> list[str]:
+    """Split a tree into grandchild-level jobs for the deleter pool."""
+    jobs = []
+    try:
+        children = list(os.scandir(root))
+    except OSError:
+        return [str(root)]
+
+    for child in children:
+        if child.is_dir(follow_symlinks=False):
+            try:
+                jobs.extend(e.path for e in os.scandir(child.path))
+            except OSError:
+                jobs.append(child.path)
+        else:
+            jobs.append(child.path)
+    return jobs
+
+
+def reclaim(trash_dirs, workers: int = None) -> int:
+    """
+    Delete everything in the trash directories using a thread pool.
+    Returns the number of trashed entries reclaimed.
+    """
+    claimed = []
+    for trash_dir in trash_dirs:
+        claimed.extend(_claim(Path(trash_dir)))
+
+    if not claimed:
+        return 0
+
+    jobs = []
+    for path in claimed:
+        if path.is_dir() and not path.is_symlink():
+            jobs.extend(_fan_out(path))
+
+    workers = workers or min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for _ in pool.map(_remove_any, jobs):
+            pass
+
+    # Only the emptied skeletons are left
+    for path in claimed:
+        _remove_any(str(path))
+
+    return len(claimed)
+
+
+def reaping_elsewhere(trash_dirs) -> dict:
+    """{pid: entry count} for entries other live reapers are deleting."""
+    pending = {}
+    me = os.getpid()
+    for trash_dir in trash_dirs:
+        try:
+            with os.scandir(trash_dir) as it:
+                names = [e.name for e in it]
+        except OSError:
+            continue
+        for name in names:
+            if _owned_by_live_reaper(name):
+                owner = name[len(REAPING_PREFIX):].partition("-")[0]
+                if owner.isdigit() and int(owner) != me:
+                    pending[int(owner)] = pending.get(int(owner), 0) + 1
+    return pending
+
+
+def has_garbage(trash_dirs) -> bool:
+    """True if the trash holds anything a new reaper could claim."""
+    for trash_dir in trash_dirs:
+        try:
+            with os.scandir(trash_dir) as it:
+                if any(not _owned_by_live_reaper(e.name) for e in it):
+                    return True
+        except OSError:
+            continue
+    return False
+
+
+def spawn_reaper(trash_dirs):
+    """
+    Reclaim the trash in a detached background process.
+
+    Does nothing if the trash is empty. Where fork() is unavailable the
+    trash is simply left for the next invocation or `sevpy gc`.
+    """
+    if not has_garbage(trash_dirs):
+        return
+
+    try:
+        pid = os.fork()
+    except (AttributeError, OSError):
+        return
+
+    if pid:
+        # Reap the intermediate child; the grandchild is reparented to init
+        os.waitpid(pid, 0)
+        return
+
+    try:
+        os.setsid()
+        if os.fork():
+            os._exit(0)
+
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+
+        reclaim(trash_dirs)
+    finally:
+        os._exit(0)
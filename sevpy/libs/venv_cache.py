@@ -0,0 +1,202 @@
+import json
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+from libs.fs_ops import reflink
+from libs.path_utils import walk_tree
+
+TEMPLATE_ROOT = Path.home() / ".cache" / "sevpy" / "venv-templates"
+
+MANIFEST_NAME = ".install-manifest"
+META_NAME = "template.json"
+
+# Files larger than this are never rewritten (they are not scripts/configs)
+FIXUP_MAX_SIZE = 1024 * 1024
+
+
+class VenvError(Exception):
+    """Template build or clone failure"""
+    pass
+
+
+def manifest_key(prefix: Path) -> str:
+    """
+    Identity of an installed prefix. Commit, reinstall and rollback all
+    replace the manifest, so any of them invalidates existing templates.
+    """
+    try:
+        st = (prefix / MANIFEST_NAME).stat()
+    except OSError:
+        raise VenvError(f"Not a sevpy-managed installation: {prefix}")
+    return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _find_fixups(venv: Path, origin: bytes) -> list[str]:
+    """Files (activate scripts, pip shebangs, pyvenv.cfg) that embed the venv path."""
+    fixups = []
+    root = str(venv)
+
+    for entry in walk_tree(venv):
+        if entry.name.endswith(".pyc") or not entry.is_file(follow_symlinks=False):
+            continue
+        try:
+            if entry.stat(follow_symlinks=False).st_size > FIXUP_MAX_SIZE:
+                continue
+            with open(entry.path, "rb") as f:
+                if origin in f.read():
+                    fixups.append(entry.path[len(root) + 1:])
+        except OSError:
+            continue
+
+    return fixups
+
+
+def build_template(python: Path, prefix: Path, template_dir: Path) -> dict:
+    """
+    Create a seeded venv for `prefix` and publish it atomically at
+    `template_dir`. Concurrent builders race harmlessly: the loser's
+    copy is discarded.
+    """
+    key = manifest_key(prefix)
+
+    template_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp = template_dir.with_name(f".{template_dir.name}.{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    venv = tmp / "venv"
+
+    cmd = [str(python), "-m", "venv"]
+    major_minor = python.name.removeprefix("python")
+    seeded = (prefix / "lib" / f"python{major_minor}" / "ensurepip" / "_bundled").is_dir()
+    if not seeded:
+        # e.g. pruned by the 'minimal' install profile
+        print(
+            f"[!] {prefix.name} has no bundled pip wheels (minimal profile?); "
+            "environments will be created without pip"
+        )
+        cmd.append("--without-pip")
+
+    try:
+        subprocess.run(
+            [*cmd, str(venv)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            check=True,
+        )
+    except subprocess.CalledProcessError as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise VenvError(f"Creating template venv failed:\n{e.stdout}")
+
+    origin = str(venv)
+    meta = {
+        "key": key,
+        "origin": origin,
+        "pip": seeded,
+        "fixups": _find_fixups(venv, os.fsencode(origin)),
+    }
+    (tmp / META_NAME).write_text(json.dumps(meta))
+
+    # Retire a stale template, then publish ours
+    if template_dir.exists():
+        stale = template_dir.with_name(f".{template_dir.name}.stale.{os.getpid()}")
+        try:
+            template_dir.rename(stale)
+            shutil.rmtree(stale, ignore_errors=True)
+        except OSError:
+            pass
+
+    try:
+        tmp.rename(template_dir)
+    except OSError:
+        # Someone else published first
+        shutil.rmtree(tmp, ignore_errors=True)
+        return load_template(template_dir)
+
+    return meta
+
+
+def load_template(template_dir: Path):
+    try:
+        return json.loads((template_dir / META_NAME).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def ensure_template(python: Path, prefix: Path) -> tuple[Path, dict]:
+    template_dir = TEMPLATE_ROOT / prefix.name
+    meta = load_template(template_dir)
+
+    # Templates from before "pip" was recorded are rebuilt once
+    if meta is None or meta.get("key") != manifest_key(prefix) or "pip" not in meta:
+        print(f"[*] Building venv template for {prefix.name} (one-off)...")
+        meta = build_template(python, prefix, template_dir)
+
+    return template_dir / "venv", meta
+
+
+def clone_template(venv: Path, meta: dict, dest: Path) -> str:
+    """
+    Clone a template venv into `dest`.
+
+    Files are reflinked where the filesystem supports it, otherwise
+    hard-linked, otherwise copied; files embedding the template path are
+    rewritten. Returns the method used for the bulk of the files.
+    """
+    origin = os.fsencode(meta["origin"])
+    target = os.fsencode(str(dest))
+    fixups = set(meta["fixups"])
+
+    # First failure of a method disables it for the rest of the clone
+    methods = ["reflink", "hardlink", "copy"]
+
+    def place(src, dst):
+        while True:
+            method = methods[0]
+            try:
+                if method == "reflink":
+                    if reflink(src, dst):
+                        shutil.copystat(src, dst)
+                        return
+                elif method == "hardlink":
+                    os.link(src, dst)
+                    return
+                else:
+                    shutil.copy2(src, dst)
+                    return
+            except OSError:
+                if method == "copy":
+                    raise
+            methods.pop(0)
+
+    try:
+        dest.mkdir(parents=True)
+    except FileExistsError:
+        raise VenvError(f"Destination already exists: {dest}")
+
+    root = str(venv)
+
+    try:
+        # Directories are listed before their contents
+        for entry in walk_tree(venv):
+            rel = entry.path[len(root) + 1:]
+            dst = dest / rel
+
+            if entry.is_symlink():
+                os.symlink(os.readlink(entry.path), dst)
+            elif entry.is_dir():
+                dst.mkdir()
+            elif rel in fixups:
+                with open(entry.path, "rb") as f:
+                    data = f.read().replace(origin, target)
+                dst.write_bytes(data)
+                shutil.copymode(entry.path, dst)
+            else:
+                place(entry.path, dst)
+    except BaseException:
+        # Only ever remove what this clone created
+        shutil.rmtree(dest, ignore_errors=True)
+        raise
+
+    return methods[0]
@@ -1,19 +1,34 @@
 #!/usr/bin/env python3
 
+import sys
+
+# `run` and `which` sit on job runners' hot path: hand them off before
+# any of the heavier imports below.
+if __name__ == "__main__" and sys.argv[1:2] in (["run"], ["which"]):
+    from libs.dispatch import main as dispatch_main
+    sys.exit(dispatch_main(sys.argv[1:]))
+
 import os
 import shutil
-import sys
 import tarfile
 import subprocess
 import re
-import requests as req
-from tqdm import tqdm
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from colorama import Fore, init as colorama_init
 
 colorama_init(autoreset=True)
 
-from libs.installer import Installer, InstallAbort
+from libs.installer import Installer, InstallAbort, version_tuple
+from libs.pruning import get_profile, PROFILES
+from libs.progress import PROGRESS_MODES
+from libs.smoke import DEFAULT_BUDGET
+from libs.trash import remove_tree, reclaim, reaping_elsewhere, spawn_reaper
+from libs.fs_ops import exchange_paths
+from libs.dispatch import find_interpreter
+from libs.venv_cache import VenvError, ensure_template, clone_template
+from libs.sync import LOCK_NAME, LockError, load_lock, plan_sync, normalize_build_options
 
 SEVPY_VERSION = "v1.0.0"
 
@@ -22,6 +37,15 @@ INSTALL_ROOT = Path.home() / ".local" / "opt"
 SEVPY_CACHE = Path.home() / ".cache" / "sevpy"
 INSTALLER_STAGE = Path.home() / ".cache" / "python-installer" / "stage"
 
+# Deleted trees are renamed into a trash directory on the same filesystem
+# and reclaimed in the background.
+TRASH_DIRS = (
+    INSTALL_ROOT / ".sevpy-trash",
+    Path.home() / ".cache" / "sevpy-trash",
+)
+# Previous builds replaced by `reinstall`, kept for `rollback`
+ROLLBACK_ROOT = INSTALL_ROOT / ".sevpy-rollback"
+
 # ----------------------------
 # GPG helpers (unchanged logic)
 # ----------------------------
@@ -34,6 +58,10 @@ def extract_key_id(gpg_output):
 
 
 def download_file(url, out_path):
+    # Imported here to keep them off the start-up path of other commands
+    import requests as req
+    from tqdm import tqdm
+
     r = req.get(url, stream=True, timeout=(10, 60))
     if r.status_code != 200:
         raise RuntimeError(f"HTTP {r.status_code} while downloading {url}")
@@ -69,7 +97,7 @@ def gpg_import_key(key_id):
     )
 
 
-def gpg_verify(archive_path, asc_path):
+def gpg_verify(archive_path, asc_path, interactive=True):
     result = subprocess.run(
         ["gpg", "--verify", asc_path, archive_path],
         stdout=subprocess.PIPE,
@@ -88,6 +116,12 @@ def gpg_verify(archive_path, asc_path):
         print(f"[!] Key ID: {key_id}")
         print("[!] This key belongs to a Python Release Manager")
 
+        if not interactive:
+            # Never trust a new key without a human saying so
+            print("[X] Not importing keys non-interactively. Import it first with:")
+            print(f"    gpg --keyserver hkps://keys.openpgp.org --recv-keys {key_id}")
+            return False
+
         choice = input("Import this key? [y/N]: ").strip().lower()
         if choice != "y":
             print("[X] User declined key import")
@@ -141,11 +175,28 @@ def confirm_eol_version(version, skip=False):
     choice = input("Do you want to continue? [y/N]: ").strip().lower()
     return choice == "y", True
 
-def install(version, reinstall=False, enable_tkinter=True):
-    eol = confirm_eol_version(version, skip=reinstall)
+def install(
+    version,
+    reinstall=False,
+    enable_tkinter=True,
+    precompile=False,
+    pyc_levels=(0, 1, 2),
+    unchecked_hash=False,
+    profile=None,
+    progress=None,
+    smoke_test=False,
+    smoke_budget=None,
+    assume_yes=False,
+    build_jobs=None,
+):
+    """
+    Download, verify, build and commit a Python version.
+    Returns True on success. With assume_yes nothing is asked on stdin.
+    """
+    eol = confirm_eol_version(version, skip=reinstall or assume_yes)
     if not eol[0]:
         print(Fore.RED + "[*] Aborted by user.")
-        return
+        return False
     base_url = f"https://www.python.org/ftp/python/{version}"
     archive = f"Python-{version}.tar.xz"
     signature = f"{archive}.asc"
@@ -164,9 +215,9 @@ def install(version, reinstall=False, enable_tkinter=True):
         download_file(f"{base_url}/{archive}", archive_path)
         download_file(f"{base_url}/{signature}", sig_path)
 
-        if not eol[1] and not gpg_verify(archive_path, sig_path):
+        if not eol[1] and not gpg_verify(archive_path, sig_path, interactive=not assume_yes):
             print(Fore.RED + "[X] Aborting: source is not trusted")
-            return
+            return False
         
         if eol[1]:
             print(Fore.YELLOW + "[*] Skipping GPG Signature check, No  GPG signatures found!")
@@ -180,14 +231,34 @@ def install(version, reinstall=False, enable_tkinter=True):
         installer = Installer(
             python_source_directory=source_tree,
             version=version,
+            replace=reinstall,
+            progress=progress,
+            build_options=normalize_build_options(
+                enable_tkinter=enable_tkinter,
+                profile=profile,
+                precompile=precompile,
+                pyc_levels=pyc_levels,
+                unchecked_hash=unchecked_hash,
+            ),
+            build_jobs=build_jobs,
         )
 
         installer.configure()
         installer.compile()
-        installer.staged_install(enable_tk=enable_tkinter)
+        installer.staged_install(precompile=precompile, unchecked_hash=unchecked_hash)
+        if smoke_test:
+            # Before pruning: profiles may drop the test suite
+            installer.smoke_test(budget=smoke_budget or DEFAULT_BUDGET)
+        installer.prune_staging(profile=profile, enable_tk=enable_tkinter)
+        if precompile:
+            installer.precompile_bytecode(
+                optimize_levels=pyc_levels,
+                unchecked_hash=unchecked_hash,
+            )
         installer.verify_staging()
         installer.commit_install()
         installer.final_thing()
+        return True
 
     except InstallAbort as e:
         print(Fore.RED + f"[X] Installation aborted: {e}")
@@ -202,6 +273,8 @@ def install(version, reinstall=False, enable_tkinter=True):
         except Exception:
             pass
 
+    return False
+
 def check_activated(version: str) -> bool:
     """
     Check whether python<major>.<minor> resolved from PATH
@@ -331,7 +404,7 @@ def clean():
 
         print(f"[!] Cleaning {path}")
         try:
-            shutil.rmtree(path)
+            remove_tree(path, TRASH_DIRS)
             removed_any = True
             print(f"[+] Removed {path}")
         except Exception as e:
@@ -339,6 +412,22 @@ def clean():
 
     if not removed_any:
         print("[+] Nothing to clean")
+    else:
+        spawn_reaper(TRASH_DIRS)
+
+def remove_prefix(prefix):
+    """
+    Trash an installation along with the build kept for rollback, so that
+    `sevpy rollback` cannot bring back a removed version.
+    """
+    remove_tree(prefix, TRASH_DIRS)
+
+    previous = ROLLBACK_ROOT / prefix.name
+    if previous.exists():
+        try:
+            remove_tree(previous, TRASH_DIRS)
+        except Exception as e:
+            print(f"[X] Failed to remove rollback copy {previous}: {e}")
 
 def remove_broken():
     installed = find_installed_versions()
@@ -351,7 +440,7 @@ def remove_broken():
         prefix = info["prefix"]
         print(f"[!] Removing broken Python {version}")
         try:
-            shutil.rmtree(prefix)
+            remove_prefix(prefix)
             removed_any = True
             print(f"[+] Removed {prefix}")
         except Exception as e:
@@ -359,6 +448,8 @@ def remove_broken():
 
     if not removed_any:
         print("[+] No broken installations found")
+    else:
+        spawn_reaper(TRASH_DIRS)
 
 def remove_version(version, no_confirm=False):
     prefix = INSTALL_ROOT / f"python-{version}"
@@ -378,12 +469,160 @@ def remove_version(version, no_confirm=False):
 
     print(Fore.CYAN + f"[!] Removing Python {version} ...")
     try:
-        shutil.rmtree(prefix)
+        remove_prefix(prefix)
         print(f"[+] Removed Python {version}")
     except Exception as e:
         print(f"[X] Failed to remove Python {version}: {e}")
+        return
 
-def reinstall_version(version, no_check=False, enable_tkinter=True):
+    spawn_reaper(TRASH_DIRS)
+
+def rollback_version(version):
+    prefix = INSTALL_ROOT / f"python-{version}"
+    previous = ROLLBACK_ROOT / f"python-{version}"
+
+    if not previous.exists():
+        print(f"[X] No previous build of Python {version} to roll back to")
+        return
+
+    try:
+        if prefix.exists():
+            # The current build takes the rollback slot, so this is reversible
+            exchange_paths(previous, prefix)
+        else:
+            previous.rename(prefix)
+    except Exception as e:
+        print(f"[X] Rollback failed: {e}")
+        return
+
+    print(f"[+] Rolled back Python {version} to the previous build")
+
+def create_venv(spec, dest):
+    python = find_interpreter(spec)
+    if python is None:
+        print(f"[X] No installed Python matches {spec}")
+        return
+
+    python = Path(python)
+    prefix = python.parent.parent
+    dest = Path(dest).absolute()
+
+    t1 = time.time()
+    try:
+        template, meta = ensure_template(python, prefix)
+        method = clone_template(template, meta, dest)
+    except VenvError as e:
+        print(Fore.RED + f"[X] {e}")
+        return
+    except Exception as e:
+        print(Fore.RED + f"[X] Failed to create virtual environment: {e}")
+        return
+    t2 = time.time()
+
+    print(f"[+] Created {dest} from {prefix.name} ({method}) in {(t2 - t1) * 1000:.0f} ms")
+    if not meta["pip"]:
+        print(Fore.YELLOW + f"[!] No pip in this environment: {prefix.name} was installed without ensurepip wheels")
+    print(f'    Activate with: source "{dest / "bin" / "activate"}"')
+
+def sync(lock_path, dry_run=False, progress=None):
+    t1 = time.time()
+    try:
+        settings, desired = load_lock(lock_path)
+    except LockError as e:
+        print(Fore.RED + f"[X] {e}")
+        return False
+
+    plan = plan_sync(settings, desired, INSTALL_ROOT)
+    changes = plan["install"] + plan["rebuild"] + plan["remove"]
+
+    for version in plan["conflict"]:
+        print(
+            Fore.RED + f"[X] Python {version}: {INSTALL_ROOT / f'python-{version}'} "
+            "exists but is not managed by sevpy; remove it by hand to let sync install it"
+        )
+    ok = not plan["conflict"]
+
+    if not changes:
+        if ok:
+            print(f"[+] In sync: {len(plan['ok'])} versions up to date ({time.time() - t1:.2f}s)")
+        return ok
+
+    for action in ("install", "rebuild", "remove"):
+        for version in plan[action]:
+            print(f"  {action:<8} Python {version}")
+
+    if dry_run:
+        return ok
+
+    # Removals are instant renames into the trash
+    for version in plan["remove"]:
+        try:
+            remove_prefix(INSTALL_ROOT / f"python-{version}")
+            print(f"[+] Removed Python {version}")
+        except Exception as e:
+            print(Fore.RED + f"[X] Failed to remove Python {version}: {e}")
+            ok = False
+    if plan["remove"]:
+        spawn_reaper(TRASH_DIRS)
+
+    builds = [(v, False) for v in plan["install"]] + [(v, True) for v in plan["rebuild"]]
+    if builds:
+        jobs = min(settings["jobs"], len(builds))
+        build_jobs = max((os.cpu_count() or 1) // jobs, 1)
+        if progress is None and jobs > 1:
+            # Interleaved progress bars are unreadable
+            progress = "none"
+
+        def build(job):
+            version, rebuild = job
+            return install(
+                version,
+                reinstall=rebuild,
+                assume_yes=True,
+                build_jobs=build_jobs,
+                progress=progress,
+                **desired[version],
+            )
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(build, builds))
+        # Staging trees and replaced builds went to the trash; forked
+        # only now that the build threads are gone
+        spawn_reaper(TRASH_DIRS)
+        ok = ok and all(results)
+
+    if ok:
+        print(Fore.GREEN + f"[+] Sync complete in {time.time() - t1:.1f}s")
+    else:
+        print(Fore.RED + "[X] Sync finished with errors")
+    return ok
+
+def gc():
+    print("[*] Reclaiming trashed installations...")
+    t1 = time.time()
+    count = reclaim(TRASH_DIRS)
+
+    # Entries a background reaper already claimed: wait until they are
+    # gone, taking over whatever a reaper that dies half-way leaves
+    pending = reaping_elsewhere(TRASH_DIRS)
+    waited = bool(pending)
+    if pending:
+        owners = ", ".join(f"{n} by PID {pid}" for pid, n in pending.items())
+        print(f"[*] Waiting for background reclaim to finish ({owners})...")
+    while pending:
+        time.sleep(0.2)
+        count += reclaim(TRASH_DIRS)
+        pending = reaping_elsewhere(TRASH_DIRS)
+    t2 = time.time()
+
+    if count:
+        print(f"[+] Reclaimed {count} trashed entries in {t2 - t1:.1f} seconds")
+    elif waited:
+        print(f"[+] Background reclaim finished; trash is empty ({t2 - t1:.1f} seconds)")
+    else:
+        print("[+] Trash is empty")
+
+def reinstall_version(version, no_check=False, **build_options):
     prefix = INSTALL_ROOT / f"python-{version}"
 
     if not no_check and not prefix.exists():
@@ -392,27 +631,98 @@ def reinstall_version(version, no_check=False, enable_tkinter=True):
 
     if prefix.exists():
         print(Fore.YELLOW + f"[!] Reinstalling Python {version}")
-        print(Fore.YELLOW + "[!] Existing installation will be removed")
+        print(Fore.YELLOW + "[!] The new build is made alongside the existing one and swapped in")
+        print(Fore.YELLOW + "[!] only once verified; the old build is kept for 'sevpy rollback'.")
 
         confirm = input("Are you sure you want to continue? [y/N]: ").strip().lower()
         if confirm != "y":
             print(Fore.RED + "[*] Aborted.")
             return
-
-        try:
-            shutil.rmtree(prefix)
-            print(f"[+] Removed existing Python {version}")
-        except Exception as e:
-            print(f"[X] Failed to remove existing installation: {e}")
-            return
     else:
         print(Fore.YELLOW + f"[!] Python {version} not found — proceeding with fresh install")
 
     # Proceed with fresh install
-    install(version, reinstall=True, enable_tkinter=enable_tkinter)
+    install(version, reinstall=True, **build_options)
+    spawn_reaper(TRASH_DIRS)
+
+KNOWN_FLAGS = (
+    "--yes",
+    "--no-tk",
+    "--precompile",
+    "--pyc-levels",
+    "--unchecked-hash",
+    "--profile",
+    "--progress",
+    "--smoke-test",
+    "--smoke-budget",
+    "--dry-run",
+)
 
 def is_pyinstaller_internal_flag(arg):
-    return arg.startswith("-") and arg not in ("--yes", "--no-tk")
+    return arg.startswith("-") and arg.split("=", 1)[0] not in KNOWN_FLAGS
+
+def get_flag_value(args, flag, default=None):
+    for arg in args:
+        if arg.startswith(f"{flag}="):
+            return arg.split("=", 1)[1]
+    return default
+
+def build_options_from_args(args, version=None):
+    """
+    Translate install/reinstall flags into keyword arguments for install().
+    Raises ValueError on malformed flag values, or on flags `version`
+    cannot support.
+    """
+    options = {
+        # checking if --no-tk is provided as argument to prevent tkinter installation
+        "enable_tkinter": "--no-tk" not in args,
+        "precompile": "--precompile" in args,
+        "unchecked_hash": "--unchecked-hash" in args,
+        "smoke_test": "--smoke-test" in args,
+    }
+
+    budget = get_flag_value(args, "--smoke-budget")
+    if budget is not None:
+        try:
+            options["smoke_budget"] = float(budget)
+        except ValueError:
+            raise ValueError(f"Invalid --smoke-budget value: {budget}")
+        if options["smoke_budget"] <= 0:
+            raise ValueError(f"--smoke-budget must be positive: {budget}")
+        options["smoke_test"] = True
+
+    levels = get_flag_value(args, "--pyc-levels")
+    if levels is not None:
+        try:
+            options["pyc_levels"] = tuple(int(l) for l in levels.split(","))
+        except ValueError:
+            raise ValueError(f"Invalid --pyc-levels value: {levels}")
+        if any(l not in (0, 1, 2) for l in options["pyc_levels"]):
+            raise ValueError(f"Optimization levels must be 0, 1 or 2: {levels}")
+
+    profile = get_flag_value(args, "--profile")
+    if profile is not None:
+        get_profile(profile)  # validates the name
+        options["profile"] = profile
+
+    progress = get_flag_value(args, "--progress")
+    if progress is not None:
+        if progress not in PROGRESS_MODES:
+            raise ValueError(
+                f"Invalid --progress value: {progress} "
+                f"(expected one of: {', '.join(PROGRESS_MODES)})"
+            )
+        options["progress"] = progress
+
+    # Choosing levels or the pyc mode only makes sense with the stage enabled
+    if levels is not None or options["unchecked_hash"]:
+        options["precompile"] = True
+
+    # Caught here rather than after a full configure and make
+    if options["unchecked_hash"] and version and version_tuple(version)[:2] < (3, 7):
+        raise ValueError("--unchecked-hash requires Python 3.7+")
+
+    return options
 
 def print_help():
     print(f"""
@@ -425,13 +735,23 @@ USAGE:
 COMMANDS:
     version
     :  See the currently installed Version.
-  install <version>
+  install <version> [--profile=NAME] [--precompile] [--pyc-levels=0,1,2] [--unchecked-hash]
     :  Download, build, and install Python from source.
   reinstall <version> [--yes]
-    :  Reinstall an existing Python version.
+    :  Rebuild an existing Python version and atomically swap it in.
+    :  The installed version keeps working during the build.
     :  --yes    Skip confirmation prompt.
+  rollback <version>
+    :  Swap back the build replaced by the last reinstall.
   list
     :  List all installed Python versions and their status.
+  which <version>
+    :  Print the interpreter path for a version (3.12 -> newest 3.12.x).
+  run <version> [--] [args...]
+    :  Run an installed interpreter directly, without touching PATH.
+  venv <version> <dir>
+    :  Create a virtual environment from an installed Python by cloning
+    :  a cached, pip-seeded template (built once per installation).
   remove <version> [--yes]
     :  Remove a specific Python version.
     :  --yes    Skip confirmation prompt.
@@ -439,6 +759,13 @@ COMMANDS:
     :  Remove all detected broken installations.
   clean
     :  Remove cached sources and staging directories.
+  sync [lock-file] [--dry-run]
+    :  Converge installed versions to a lock file (default: ./{LOCK_NAME}).
+    :  Installs, rebuilds and removes only what differs; never prompts.
+    :  --dry-run    Only show what would change.
+  gc
+    :  Immediately reclaim disk space from removed installations.
+    :  (Removals are instant; space is normally freed in the background.)
   version
     :  Show sevpy version information.
   help
@@ -447,13 +774,42 @@ FLAGS:
     --no-tk
     :    Disable Tkinter support (passed to installer).
     :    May cause some tests to fail, but can resolve certain build issues.
+    --profile=NAME
+    :    Slim the install using a profile ({", ".join(PROFILES)}).
+    :    server : strip debug symbols, drop test suites, IDLE, turtledemo
+    :             and static libraries.
+    :    minimal: as server, plus the bundled ensurepip wheels.
+    --progress=bar|json|none
+    :    How build progress is reported. The ETA comes from previous builds
+    :    of the same version on this host. json writes one JSON object per
+    :    line to stderr for automation. Default: bar on a terminal, none otherwise.
+    --smoke-test
+    :    Run a curated subset of the CPython test suite (ssl, sqlite3,
+    :    ctypes, hashlib, compression, ...) against the staged build in
+    :    parallel; any failure aborts before the install is committed.
+    --smoke-budget=SECONDS
+    :    Time budget for the smoke tests (default {DEFAULT_BUDGET}, implies --smoke-test).
+    --precompile
+    :    Have make altinstall compile the stdlib on every CPU core (via
+    :    COMPILEALL_OPTS; Makefiles without it keep their own compile).
+    --pyc-levels=0,1,2
+    :    Optimization levels to keep .pyc files for (implies --precompile).
+    --unchecked-hash
+    :    Write unchecked hash-based .pyc files for faster imports
+    :    (implies --precompile, Python 3.7+).
 EXAMPLES:
   sevpy install 3.12.2
   sevpy list
   sevpy remove 3.8.9
   sevpy reinstall 3.12.2 --yes
+  sevpy which 3.12
+  sevpy run 3.12 -- script.py
+  sevpy venv 3.12 .venv
   sevpy reinstall 3.7.13 --no-tk
   sevpy install 2.7.18 --no-tk
+  sevpy install 3.12.2 --pyc-levels=0 --unchecked-hash
+  sevpy install 3.12.2 --profile=minimal --no-tk
+  sevpy reinstall 3.12.2 --smoke-test
   sevpy clean
 
 {Fore.CYAN}NOTES:{Fore.RESET}
@@ -491,6 +847,10 @@ def main():
 
     cmd = args[0].lower()
 
+    # Finish reclaiming anything an earlier run left in the trash
+    if cmd != "gc":
+        spawn_reaper(TRASH_DIRS)
+
     if cmd == "help":
         print_help()
     elif cmd == "version":
@@ -500,12 +860,17 @@ def main():
             print(Fore.RED + "Error: specify a version (e.g. 3.12.2)")
             return
         version = args[1]
-        enable_tkinter = not ("--no-tk" in args) # checking if --no-tk is provided as argument to prevent tkinter installation
+        try:
+            build_options = build_options_from_args(args, version)
+        except ValueError as e:
+            print(Fore.RED + f"Error: {e}")
+            return
         for _version, info in find_installed_versions().items():
             if version == _version:
                 print(Fore.GREEN + f"[+] Version Python-{version} already exists at {info['prefix']}")
                 return
-        install(version, enable_tkinter=enable_tkinter)
+        install(version, **build_options)
+        spawn_reaper(TRASH_DIRS)
 
     elif cmd == "list":
         installed = find_installed_versions()
@@ -544,10 +909,36 @@ def main():
             return
         version = args[1]
         no_confirm = "--yes" in args
-        enable_tkinter = not ("--no-tk" in args)
-        reinstall_version(version, no_check=no_confirm, enable_tkinter=enable_tkinter)
+        try:
+            build_options = build_options_from_args(args, version)
+        except ValueError as e:
+            print(Fore.RED + f"Error: {e}")
+            return
+        reinstall_version(version, no_check=no_confirm, **build_options)
+    elif cmd == "venv":
+        if len(args) < 3:
+            print(Fore.RED + "Error: specify a version and a directory (e.g. 3.12 .venv)")
+            return
+        create_venv(args[1], args[2])
+    elif cmd == "rollback":
+        if len(args) < 2:
+            print(Fore.RED + "Error: specify a version (e.g. 3.12.2)")
+            return
+        rollback_version(args[1])
+    elif cmd == "sync":
+        paths = [a for a in args[1:] if not a.startswith("-")]
+        lock_path = Path(paths[0]) if paths else Path.cwd() / LOCK_NAME
+        try:
+            progress = build_options_from_args(args).get("progress")
+        except ValueError as e:
+            print(Fore.RED + f"Error: {e}")
+            return
+        if not sync(lock_path, dry_run="--dry-run" in args, progress=progress):
+            sys.exit(1)
     elif cmd == "clean":
         clean()
+    elif cmd == "gc":
+        gc()
     else:
         print(Fore.RED + f"Unknown command: {cmd}")
         print_help()